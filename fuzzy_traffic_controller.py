@@ -4,9 +4,136 @@ This module implements a fuzzy logic system to control traffic lights based on
 vehicle queue length and waiting time.
 """
 
+import hashlib
+import os
+import tempfile
+
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
+from numba import njit, prange
+
+
+# Membership function parameters (triangular: [a, b, c])
+QUEUE_LENGTH_MFS = {
+    'low': [0, 0, 15],
+    'medium': [10, 25, 40],
+    'high': [35, 50, 50],
+}
+WAITING_TIME_MFS = {
+    'short': [0, 0, 100],
+    'medium': [60, 150, 240],
+    'long': [200, 300, 300],
+}
+GREEN_TIME_MFS = {
+    'short': [10, 10, 30],
+    'medium': [25, 50, 75],
+    'long': [60, 90, 90],
+}
+
+# Rule base: (queue_length term, waiting_time term) -> green_time term
+RULES = [
+    ('low', 'short', 'short'),
+    ('low', 'medium', 'short'),
+    ('low', 'long', 'medium'),
+    ('medium', 'short', 'medium'),
+    ('medium', 'medium', 'medium'),
+    ('medium', 'long', 'long'),
+    ('high', 'short', 'medium'),
+    ('high', 'medium', 'long'),
+    ('high', 'long', 'long'),
+]
+
+MAX_QUEUE = 50
+MAX_WAIT = 300
+MIN_GREEN = 10
+MAX_GREEN = 90
+
+# Waiting time quantization step (s) for memoized green time lookups
+WAIT_BIN = 5
+
+# Bump when the inference used to build the lookup table changes
+LUT_VERSION = 2
+
+LUT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Quantized lookup tables already loaded in this process, keyed by config hash
+_LUT_CACHE = {}
+
+
+def config_hash():
+    """Short hash of the fuzzy system configuration, used to key the LUT file."""
+    config = (
+        sorted(QUEUE_LENGTH_MFS.items()),
+        sorted(WAITING_TIME_MFS.items()),
+        sorted(GREEN_TIME_MFS.items()),
+        RULES,
+        MAX_QUEUE,
+        MAX_WAIT,
+        MIN_GREEN,
+        MAX_GREEN,
+        LUT_VERSION,
+    )
+    return hashlib.sha1(repr(config).encode()).hexdigest()[:12]
+
+
+@njit(cache=True, fastmath=True)
+def _trimf(x, a, b, c):
+    """Triangular membership of x for parameters [a, b, c]."""
+    if x < a or x > c:
+        return 0.0
+    if x <= b:
+        return 1.0 if b == a else (x - a) / (b - a)
+    return 1.0 if c == b else (c - x) / (c - b)
+
+
+@njit(cache=True, fastmath=True)
+def mamdani(q, w, queue_params, wait_params, green_params, rule_q, rule_w, rule_o):
+    """
+    Mamdani inference for a single (queue_length, waiting_time) input.
+
+    Uses min for AND and implication, max for aggregation and centroid
+    defuzzification over the integer green_time universe.
+    """
+    n_q = queue_params.shape[0]
+    n_w = wait_params.shape[0]
+    n_out = green_params.shape[0]
+
+    q_mu = np.empty(n_q)
+    for i in range(n_q):
+        q_mu[i] = _trimf(q, queue_params[i, 0], queue_params[i, 1], queue_params[i, 2])
+    w_mu = np.empty(n_w)
+    for j in range(n_w):
+        w_mu[j] = _trimf(w, wait_params[j, 0], wait_params[j, 1], wait_params[j, 2])
+
+    # Rule activation, max-combined per output term
+    activation = np.zeros(n_out)
+    for r in range(rule_o.shape[0]):
+        strength = min(q_mu[rule_q[r]], w_mu[rule_w[r]])
+        if strength > activation[rule_o[r]]:
+            activation[rule_o[r]] = strength
+
+    num = 0.0
+    den = 0.0
+    for y in range(MIN_GREEN, MAX_GREEN + 1):
+        mu = 0.0
+        for k in range(n_out):
+            clipped = min(activation[k], _trimf(y, green_params[k, 0], green_params[k, 1],
+                                                green_params[k, 2]))
+            if clipped > mu:
+                mu = clipped
+        num += y * mu
+        den += mu
+
+    return num / den if den > 0 else 0.0
+
+
+@njit(cache=True, parallel=True)
+def _build_lut(queue_params, wait_params, green_params, rule_q, rule_w, rule_o):
+    lut = np.empty((MAX_QUEUE + 1, MAX_WAIT + 1), dtype=np.float32)
+    for q in prange(MAX_QUEUE + 1):
+        for w in range(MAX_WAIT + 1):
+            lut[q, w] = mamdani(float(q), float(w), queue_params, wait_params,
+                                green_params, rule_q, rule_w, rule_o)
+    return lut
 
 
 class FuzzyTrafficController:
@@ -19,6 +146,12 @@ class FuzzyTrafficController:
 
     Output:
     - green_time: Duration of green light phase (in seconds)
+
+    The fuzzy surface is evaluated once for every integer (queue_length,
+    waiting_time) pair and stored in a lookup table; compute_green_time
+    rounds its inputs to the table grid (waiting time in WAIT_BIN steps) and
+    memoizes the table reads. The table is cached on disk as
+    green_lut_<hash>.npy.
     """
 
     def __init__(self):
@@ -27,59 +160,93 @@ class FuzzyTrafficController:
     def setup_fuzzy_system(self):
         """Initialize fuzzy logic system with membership functions and rules."""
 
-        # Input variables
-        self.queue_length = ctrl.Antecedent(np.arange(0, 51, 1), 'queue_length')
-        self.waiting_time = ctrl.Antecedent(np.arange(0, 301, 1), 'waiting_time')
-        
-        # Output variable
-        self.green_time = ctrl.Consequent(np.arange(10, 91, 1), 'green_time')
+        self.queue_terms = list(QUEUE_LENGTH_MFS)
+        self.wait_terms = list(WAITING_TIME_MFS)
+        self.green_terms = list(GREEN_TIME_MFS)
 
-        # Define membership functions for queue_length
-        self.queue_length['low'] = fuzz.trimf(self.queue_length.universe, [0, 0, 15])
-        self.queue_length['medium'] = fuzz.trimf(self.queue_length.universe, [10, 25, 40])
-        self.queue_length['high'] = fuzz.trimf(self.queue_length.universe, [35, 50, 50])
+        # Membership function parameters, one row per linguistic term
+        self.queue_params = np.array(list(QUEUE_LENGTH_MFS.values()), dtype=np.float64)
+        self.wait_params = np.array(list(WAITING_TIME_MFS.values()), dtype=np.float64)
+        self.green_params = np.array(list(GREEN_TIME_MFS.values()), dtype=np.float64)
 
-        # Define membership functions for waiting_time
-        self.waiting_time['short'] = fuzz.trimf(self.waiting_time.universe, [0, 0, 100])
-        self.waiting_time['medium'] = fuzz.trimf(self.waiting_time.universe, [60, 150, 240])
-        self.waiting_time['long'] = fuzz.trimf(self.waiting_time.universe, [200, 300, 300])
+        self.create_rules()
 
-        # Define membership functions for green_time
-        self.green_time['short'] = fuzz.trimf(self.green_time.universe, [10, 10, 30])
-        self.green_time['medium'] = fuzz.trimf(self.green_time.universe, [25, 50, 75])
-        self.green_time['long'] = fuzz.trimf(self.green_time.universe, [60, 90, 90])
+        key = config_hash()
+        self.lut_path = os.path.join(LUT_DIR, f"green_lut_{key}.npy")
+        if key not in _LUT_CACHE:
+            _LUT_CACHE[key] = self.load_lut()
+        self._lut_q8 = _LUT_CACHE[key]
 
-        self.create_rules()
-        self.control_system = ctrl.ControlSystem(self.rules)
-        self.controller = ctrl.ControlSystemSimulation(self.control_system)
+        self._cache = {}
 
     def create_rules(self):
-        """Define fuzzy rules for traffic light control."""
-        self.rules = [
-            ctrl.Rule(self.queue_length['low'] & self.waiting_time['short'],
-                     self.green_time['short']),
-            ctrl.Rule(self.queue_length['low'] & self.waiting_time['medium'],
-                     self.green_time['short']),
-            ctrl.Rule(self.queue_length['low'] & self.waiting_time['long'],
-                     self.green_time['medium']),
-            ctrl.Rule(self.queue_length['medium'] & self.waiting_time['short'],
-                     self.green_time['medium']),
-            ctrl.Rule(self.queue_length['medium'] & self.waiting_time['medium'],
-                     self.green_time['medium']),
-            ctrl.Rule(self.queue_length['medium'] & self.waiting_time['long'],
-                     self.green_time['long']),
-            ctrl.Rule(self.queue_length['high'] & self.waiting_time['short'],
-                     self.green_time['medium']),
-            ctrl.Rule(self.queue_length['high'] & self.waiting_time['medium'],
-                     self.green_time['long']),
-            ctrl.Rule(self.queue_length['high'] & self.waiting_time['long'],
-                     self.green_time['long']),
-        ]
+        """
+        Define fuzzy rules for traffic light control.
+
+        Rule r reads: IF queue_length is queue term rule_q[r] AND
+        waiting_time is waiting term rule_w[r] THEN green_time is rule_o[r].
+        """
+        self.rule_q = np.array([self.queue_terms.index(q) for q, _, _ in RULES], dtype=np.int8)
+        self.rule_w = np.array([self.wait_terms.index(w) for _, w, _ in RULES], dtype=np.int8)
+        self.rule_o = np.array([self.green_terms.index(g) for _, _, g in RULES], dtype=np.int8)
+
+    def load_lut(self):
+        """
+        Load the lookup table from disk, building and saving it if missing.
+
+        A missing or unreadable file is rebuilt; if it cannot be saved the
+        table is only kept in memory.
+
+        Returns:
+            np.ndarray: int8 green times of shape (MAX_QUEUE + 1, MAX_WAIT + 1)
+        """
+        lut = None
+        try:
+            lut = np.load(self.lut_path)
+        except (OSError, ValueError, EOFError):
+            pass
+        if lut is None or lut.shape != (MAX_QUEUE + 1, MAX_WAIT + 1):
+            lut = self.build_lut()
+            self.save_lut(lut)
+
+        # Green times are whole seconds in [MIN_GREEN, MAX_GREEN], so an int8
+        # table is enough and is a quarter of the float32 size
+        lut_q8 = np.ascontiguousarray(np.clip(lut, MIN_GREEN, MAX_GREEN).round(),
+                                      dtype=np.int8)
+        # Shared by every controller in the process via _LUT_CACHE
+        lut_q8.flags.writeable = False
+        return lut_q8
+
+    def save_lut(self, lut):
+        """Atomically write the float32 table to lut_path, ignoring write errors."""
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(self.lut_path))
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, lut)
+            os.replace(tmp_path, self.lut_path)
+        except OSError:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def build_lut(self):
+        """
+        Run Mamdani inference for every integer input pair.
+
+        Returns:
+            np.ndarray: float32 table of shape (MAX_QUEUE + 1, MAX_WAIT + 1)
+        """
+        return _build_lut(self.queue_params, self.wait_params, self.green_params,
+                          self.rule_q, self.rule_w, self.rule_o)
 
     def compute_green_time(self, queue_len, wait_time):
         """
         Calculate optimal green time based on queue length and waiting time.
 
+        Queue length is rounded and waiting time is quantized to
+        WAIT_BIN-second bins before reading the lookup table; results are
+        memoized per (queue, wait bin).
+
         Args:
             queue_len (int): Number of vehicles in queue
             wait_time (float): Average waiting time in seconds
@@ -87,14 +254,15 @@ class FuzzyTrafficController:
         Returns:
             float: Recommended green light duration in seconds
         """
-        queue_len = max(0, min(50, queue_len))
-        wait_time = max(0, min(300, wait_time))
-
-        self.controller.input['queue_length'] = queue_len
-        self.controller.input['waiting_time'] = wait_time
-        self.controller.compute()
+        q = min(max(float(queue_len), 0.0), MAX_QUEUE)
+        w = min(max(float(wait_time), 0.0), MAX_WAIT)
 
-        return self.controller.output['green_time']
+        key = (int(round(q)), int(round(w / WAIT_BIN)))
+        green_time = self._cache.get(key)
+        if green_time is None:
+            green_time = float(self._lut_q8[key[0], key[1] * WAIT_BIN])
+            self._cache[key] = green_time
+        return green_time
 
 
 if __name__ == "__main__":
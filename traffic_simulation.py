@@ -2,19 +2,28 @@
 SUMO Traffic Simulation with Fuzzy Logic Controller
 """
 
+import math
 import os
 import sys
 import traci
+from traci import constants as tc
 import numpy as np
 from fuzzy_traffic_controller import FuzzyTrafficController
 
 
 class TrafficSimulation:
+    # SUMO phases form a ring: even indices are green, odd are yellow
+    NUM_PHASES = 4
+
     def __init__(self, sumo_cfg_file, use_gui=True):
         self.sumo_cfg = sumo_cfg_file
         self.use_gui = use_gui
         self.fuzzy_controller = FuzzyTrafficController()
         self.tl_id = "0"
+        self.junction_id = "0"
+        # Extra distance (m) added to the junction context subscription
+        # radius beyond the farthest corner of the network
+        self.context_margin = 10
         
         self.phases = {
             'NS_green': 0,
@@ -22,25 +31,42 @@ class TrafficSimulation:
             'EW_green': 2,
             'EW_yellow': 3
         }
+        self.phase_labels = {
+            0: 'NS Green',
+            1: 'NS Yellow',
+            2: 'EW Green',
+            3: 'EW Yellow'
+        }
         
-        self.current_phase = 'NS_green'
+        self.current_phase = self.phases['NS_green']
         self.phase_start_time = 0
         self.yellow_time = 3
+        # Longest single simulationStep (s) between phase changes; bounds
+        # how stale the sampled vehicle stats can get
+        self.stats_interval = 5
         
         self.stats = {
             'total_waiting_time': 0,
             'total_vehicles': 0,
             'phase_changes': 0,
-            'avg_queue_lengths': [],
-            'avg_waiting_times': []
+            'queue_length_sum': 0.0,
+            'waiting_time_sum': 0.0,
+            'samples': 0
         }
+        # (time, phase index, duration) for every phase change, printed
+        # with the statistics instead of as the simulation runs
+        self.phase_log = []
         
         self.lanes = {
             'NS': ['N2C_0', 'N2C_1', 'S2C_0', 'S2C_1'],
             'EW': ['E2C_0', 'E2C_1', 'W2C_0', 'W2C_1']
         }
 
+        self._vehicle_results = {}
+
     def start_sumo(self):
+        global traci
+
         if 'SUMO_HOME' in os.environ:
             tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
             sys.path.append(tools)
@@ -52,25 +78,77 @@ class TrafficSimulation:
         else:
             sumo_binary = os.path.join(os.environ['SUMO_HOME'], 'bin', 'sumo')
 
+        # libsumo runs SUMO in-process and avoids the TraCI socket, but it
+        # cannot drive sumo-gui and is a separate package from traci. This
+        # rebinds the module-wide traci name, so it applies to every
+        # TrafficSimulation in the process, not just this one.
+        if self.use_gui:
+            import traci
+        else:
+            try:
+                import libsumo as traci
+            except ImportError:
+                import traci
+
         sumo_cmd = [sumo_binary, "-c", self.sumo_cfg]
+        if not self.use_gui:
+            threads = str(os.cpu_count() or 1)
+            sumo_cmd += ["--threads", threads, "--device.rerouting.threads", threads]
         traci.start(sumo_cmd)
+        self.subscribe()
+
+    def subscribe(self):
+        """Subscribe to the lane and vehicle variables read every step."""
+        for lane in self.lanes['NS'] + self.lanes['EW']:
+            traci.lane.subscribe(lane, [tc.LAST_STEP_VEHICLE_HALTING_NUMBER])
+
+        # The vehicle stats rely on this subscription seeing every vehicle,
+        # so size it to reach the farthest corner of the network
+        jx, jy = traci.junction.getPosition(self.junction_id)
+        (xmin, ymin), (xmax, ymax) = traci.simulation.getNetBoundary()
+        radius = max(math.hypot(x - jx, y - jy)
+                     for x in (xmin, xmax) for y in (ymin, ymax)) + self.context_margin
+
+        traci.junction.subscribeContext(self.junction_id, tc.CMD_GET_VEHICLE_VARIABLE,
+                                        radius,
+                                        [tc.VAR_LANE_ID, tc.VAR_WAITING_TIME,
+                                         tc.VAR_ACCUMULATED_WAITING_TIME])
+
+    def update_subscriptions(self):
+        """
+        Read the vehicle context subscription results for the current step
+        and update the vehicle stats.
+
+        The simulation may advance several seconds per step, so SUMO's
+        per-step departed/arrived lists would miss vehicles. Instead the
+        context subscription (sized in subscribe() to cover the whole
+        network) is diffed
+        against the previous sample: new IDs have departed, and vehicles
+        that disappeared have arrived with the accumulated waiting time
+        last seen for them.
+        """
+        previous = self._vehicle_results
+        current = traci.junction.getContextSubscriptionResults(self.junction_id) or {}
+        self._vehicle_results = current
+
+        self.stats['total_vehicles'] += len(current.keys() - previous.keys())
+        for veh in previous.keys() - current.keys():
+            self.stats['total_waiting_time'] += previous[veh][tc.VAR_ACCUMULATED_WAITING_TIME]
 
     def get_lane_metrics(self, lanes):
-        total_queue = 0
-        total_waiting = 0
-        vehicle_count = 0
+        lane_results = [traci.lane.getSubscriptionResults(lane) for lane in lanes]
 
-        for lane in lanes:
-            halting = traci.lane.getLastStepHaltingNumber(lane)
-            total_queue += halting
+        halts = np.fromiter((res[tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for res in lane_results),
+                            dtype=np.int32, count=len(lanes))
+        total_queue = int(halts.sum())
 
-            vehicles = traci.lane.getLastStepVehicleIDs(lane)
-            for veh in vehicles:
-                waiting_time = traci.vehicle.getWaitingTime(veh)
-                total_waiting += waiting_time
-                vehicle_count += 1
+        lane_set = set(lanes)
+        waits = np.fromiter((res[tc.VAR_WAITING_TIME]
+                             for res in self._vehicle_results.values()
+                             if res[tc.VAR_LANE_ID] in lane_set),
+                            dtype=np.float64)
 
-        avg_waiting = total_waiting / vehicle_count if vehicle_count > 0 else 0
+        avg_waiting = float(waits.mean()) if waits.size else 0.0
         return total_queue, avg_waiting
 
     def compute_optimal_green_time(self, direction):
@@ -78,82 +156,91 @@ class TrafficSimulation:
         queue_length, waiting_time = self.get_lane_metrics(lanes)
         green_time = self.fuzzy_controller.compute_green_time(queue_length, waiting_time)
         
-        self.stats['avg_queue_lengths'].append(queue_length)
-        self.stats['avg_waiting_times'].append(waiting_time)
+        self.stats['queue_length_sum'] += queue_length
+        self.stats['waiting_time_sum'] += waiting_time
+        self.stats['samples'] += 1
         
         return green_time
 
-    def set_traffic_light_phase(self, phase_name):
-        phase_index = self.phases[phase_name]
+    def set_traffic_light_phase(self, phase_index):
         traci.trafficlight.setPhase(self.tl_id, phase_index)
-        self.current_phase = phase_name
+        self.current_phase = phase_index
         self.phase_start_time = traci.simulation.getTime()
 
     def run_simulation(self, duration=3600):
         self.start_sumo()
-        step = 0
+        # libsumo raises its own TraCIException rather than the socket
+        # client's FatalTraCIError when the simulation fails
+        sumo_errors = (traci.exceptions.FatalTraCIError,)
+        if getattr(traci, 'isLibsumo', lambda: False)():
+            sumo_errors += (traci.TraCIException,)
         current_green_time = 30
         
         print("Starting Traffic Simulation with Fuzzy Logic Controller")
         print("=" * 70)
 
         try:
-            while step < duration:
-                traci.simulationStep()
-                current_time = traci.simulation.getTime()
-                elapsed = current_time - self.phase_start_time
+            current_time = traci.simulation.getTime()
+            end_time = current_time + duration
+            self.phase_start_time = current_time
+            while current_time < end_time:
+                if self.current_phase % 2 == 0:
+                    threshold = current_green_time
+                else:
+                    threshold = self.yellow_time
 
-                if self.current_phase == 'NS_green':
-                    if elapsed >= current_green_time:
-                        self.set_traffic_light_phase('NS_yellow')
-                        self.stats['phase_changes'] += 1
-                        print(f"Time {current_time:.0f}s: NS Yellow (3s)")
+                # Skip ahead to the next phase change, sampling stats at
+                # least every stats_interval seconds
+                next_event = math.ceil(self.phase_start_time + threshold)
+                target = current_time + 1
+                if next_event - current_time > 1:
+                    target = min(next_event, current_time + self.stats_interval)
+                target = min(target, end_time)
 
-                elif self.current_phase == 'NS_yellow':
-                    if elapsed >= self.yellow_time:
-                        current_green_time = self.compute_optimal_green_time('EW')
-                        self.set_traffic_light_phase('EW_green')
-                        print(f"Time {current_time:.0f}s: EW Green ({current_green_time:.1f}s)")
+                traci.simulationStep(target)
+                self.update_subscriptions()
+                current_time = traci.simulation.getTime()
+                elapsed = current_time - self.phase_start_time
 
-                elif self.current_phase == 'EW_green':
-                    if elapsed >= current_green_time:
-                        self.set_traffic_light_phase('EW_yellow')
+                if elapsed >= threshold:
+                    next_phase = (self.current_phase + 1) % self.NUM_PHASES
+                    if next_phase % 2 == 0:
+                        direction = 'EW' if next_phase == self.phases['EW_green'] else 'NS'
+                        current_green_time = self.compute_optimal_green_time(direction)
+                        phase_duration = current_green_time
+                    else:
                         self.stats['phase_changes'] += 1
-                        print(f"Time {current_time:.0f}s: EW Yellow (3s)")
-
-                elif self.current_phase == 'EW_yellow':
-                    if elapsed >= self.yellow_time:
-                        current_green_time = self.compute_optimal_green_time('NS')
-                        self.set_traffic_light_phase('NS_green')
-                        print(f"Time {current_time:.0f}s: NS Green ({current_green_time:.1f}s)")
+                        phase_duration = self.yellow_time
+                    self.set_traffic_light_phase(next_phase)
+                    self.phase_log.append((current_time, next_phase, phase_duration))
 
-                vehicles = traci.vehicle.getIDList()
-                self.stats['total_vehicles'] = len(vehicles)
-                
-                for veh in vehicles:
-                    self.stats['total_waiting_time'] += traci.vehicle.getWaitingTime(veh)
-
-                step += 1
-
-        except traci.exceptions.FatalTraCIError as e:
+        except sumo_errors as e:
             print(f"SUMO simulation error: {e}")
         finally:
             traci.close()
             self.print_statistics()
 
+    def print_phase_log(self):
+        for time, phase, phase_duration in self.phase_log:
+            if phase % 2 == 0:
+                print(f"Time {time:.0f}s: {self.phase_labels[phase]} ({phase_duration:.1f}s)")
+            else:
+                print(f"Time {time:.0f}s: {self.phase_labels[phase]} ({phase_duration}s)")
+
     def print_statistics(self):
+        self.print_phase_log()
+
         print("\n" + "=" * 70)
         print("SIMULATION STATISTICS")
         print("=" * 70)
         print(f"Total Phase Changes: {self.stats['phase_changes']}")
         print(f"Total Vehicles Processed: {self.stats['total_vehicles']}")
         
-        if self.stats['avg_queue_lengths']:
-            avg_queue = np.mean(self.stats['avg_queue_lengths'])
+        if self.stats['samples']:
+            avg_queue = self.stats['queue_length_sum'] / self.stats['samples']
             print(f"Average Queue Length: {avg_queue:.2f} vehicles")
-        
-        if self.stats['avg_waiting_times']:
-            avg_wait = np.mean(self.stats['avg_waiting_times'])
+
+            avg_wait = self.stats['waiting_time_sum'] / self.stats['samples']
             print(f"Average Waiting Time: {avg_wait:.2f} seconds")
         
         print("=" * 70)